@@ -0,0 +1,53 @@
+"""
+Measure the import time of sqlalchemy_nested_mutable, with and without the pydantic-backed types.
+
+    python benchmarks/import_time.py [-n RUNS]
+
+Each statement is run in a fresh interpreter with `-X importtime`, after SQLAlchemy has been imported
+(which dominates and is needed anyway). The cumulative time of the imports of this package (including
+whatever it imports, e.g. pydantic) is summed up, and the median of the runs is reported.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PACKAGE = 'sqlalchemy_nested_mutable'
+PRELUDE = "import sqlalchemy.orm, sqlalchemy.ext.mutable; "
+STATEMENTS = {
+    'MutableDict': f"from {PACKAGE} import MutableDict",
+    'MutablePydanticBaseModel': f"from {PACKAGE} import MutablePydanticBaseModel",
+}
+
+
+def import_time_us(statement: str) -> int:
+    """Return the import time (in microseconds) of this package by `statement` in a fresh interpreter."""
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PRELUDE + statement],
+        cwd=Path(__file__).parent.parent, capture_output=True, text=True, check=True,
+    ).stderr
+    total = 0
+    for line in stderr.splitlines():
+        # e.g. "import time:       123 |       4567 |   sqlalchemy"
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Top-level imports only, nested ones are already included.
+        if not name[1:].startswith(' ') and name.strip().split('.')[0] == PACKAGE:
+            total += int(cumulative)
+    return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    for label, statement in STATEMENTS.items():
+        timings = [import_time_us(statement) for _ in range(args.runs)]
+        print(f"{label:<28} {statistics.median(timings) / 1000:8.2f} ms  (median of {args.runs})")
+
+
+if __name__ == '__main__':
+    main()
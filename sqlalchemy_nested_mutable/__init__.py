@@ -1,5 +1,10 @@
-from .trackable import TrackedList, TrackedDict, TrackedPydanticBaseModel
-from .mutable import MutableList, MutableDict, MutablePydanticBaseModel
+from typing import TYPE_CHECKING, Any
+
+from .trackable import TrackedList, TrackedDict, json_serializer
+from .mutable import MutableList, MutableDict
+
+if TYPE_CHECKING:
+    from ._pydantic import TrackedPydanticBaseModel, MutablePydanticBaseModel
 
 
 __all__ = [
@@ -10,4 +15,15 @@ __all__ = [
     'MutableList',
     'MutableDict',
     'MutablePydanticBaseModel',
+
+    'json_serializer',
 ]
+
+
+def __getattr__(name: str) -> Any:
+    # Defer importing pydantic (see `._compat`) until a pydantic-backed type is accessed.
+    if name in ('TrackedPydanticBaseModel', 'MutablePydanticBaseModel'):
+        from . import _pydantic
+        globals()[name] = value = getattr(_pydantic, name)
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
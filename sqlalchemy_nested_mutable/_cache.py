@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Generic, Hashable, NamedTuple, Optional
+
+from ._typing import _T
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class LRUCache(Generic[_T]):
+    """
+    A thread-safe, size-bounded LRU mapping with hit/miss statistics.
+
+    Modeled after `functools.lru_cache`, but usable as an explicit store.
+    """
+    def __init__(self, maxsize: int):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be a positive integer")
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self._data: OrderedDict[Hashable, _T] = OrderedDict()
+        self._lock = Lock()
+
+    def __reduce__(self):
+        # Contents and lock are not picklable (nor worth pickling), e.g. when a MetaData is pickled.
+        return (self.__class__, (self.maxsize,))
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[_T]:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: _T) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} {self.info()}>"
+
+
+def payload_key(value: Any) -> Hashable:
+    """Return a compact cache key for a raw (JSON-compatible) column payload."""
+    if isinstance(value, str):
+        value = value.encode()
+    elif not isinstance(value, bytes):
+        value = json.dumps(value, separators=(',', ':'), default=str).encode()
+    return hashlib.blake2b(value, digest_size=16).digest()
@@ -1,4 +1,37 @@
-try:
-    import pydantic
-except ImportError:
-    pydantic = None
+"""
+Optional dependencies, imported on first use.
+
+Importing pydantic takes a large share of the import time of this package, so it is only imported
+when a pydantic-backed type is actually used, e.g. `from sqlalchemy_nested_mutable import MutablePydanticBaseModel`.
+"""
+import sys
+from importlib import import_module
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, Optional
+
+if TYPE_CHECKING:
+    import pydantic  # noqa: F401
+
+
+def imported_pydantic() -> Optional[ModuleType]:
+    """
+    Return pydantic if it has already been imported (by anyone), without importing it.
+
+    Enough to recognize pydantic models: no model can exist before pydantic is imported.
+    """
+    return sys.modules.get('pydantic')
+
+
+def is_pydantic_model(val: Any) -> bool:
+    return (pydantic_ := sys.modules.get('pydantic')) is not None and isinstance(val, pydantic_.BaseModel)
+
+
+def __getattr__(name: str) -> Any:
+    if name == 'pydantic':
+        try:
+            module = import_module('pydantic')
+        except ImportError:
+            module = None
+        globals()[name] = module
+        return module
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
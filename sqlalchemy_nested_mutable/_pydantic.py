@@ -0,0 +1,270 @@
+"""
+The pydantic-backed types, which are imported lazily (on first use) to keep pydantic off the import path
+of `MutableDict` / `MutableList` users.
+"""
+from __future__ import annotations
+
+import copy
+from functools import partial
+from typing import TYPE_CHECKING, Any, ClassVar, Dict, Iterable, List, Optional, TypeVar
+from typing_extensions import Self
+
+import sqlalchemy as sa
+from sqlalchemy.ext.mutable import Mutable
+from sqlalchemy.sql.type_api import TypeEngine
+
+from .trackable import TrackedObject, SerializedJSON, _copy_plain, _drop_serialized, json_serializer
+from .mutable import _with_options
+from ._rollback import restore_on_rollback
+from ._cache import CacheInfo, LRUCache, payload_key
+from ._typing import _T
+from ._compat import pydantic
+
+_P = TypeVar("_P", bound='MutablePydanticBaseModel')
+
+
+def _serializes_models(dialect) -> bool:
+    """Whether the engine was created with `json_serializer=json_serializer`, which encodes tracked models too."""
+    # SQLAlchemy keeps the `create_engine(json_serializer=...)` argument there, and its JSON types read it from there.
+    serializer = getattr(dialect, '_json_serializer', None)
+    # See through `functools.partial` and `functools.wraps` wrappers.
+    while serializer is not None and serializer is not json_serializer:
+        serializer = serializer.func if isinstance(serializer, partial) else getattr(serializer, '__wrapped__', None)
+    return serializer is not None
+
+
+if pydantic is not None:
+    class TrackedPydanticBaseModel(TrackedObject, Mutable, pydantic.BaseModel):
+        _max_depth: ClassVar[Optional[int]] = None
+        # The model class a generated `Tracked<Model>` class wraps.
+        _untracked_cls: ClassVar[Optional[type]] = None
+
+        @classmethod
+        def coerce(cls, key, value):
+            return value if isinstance(value, cls) else cls.parse_obj(value)
+
+        def __init__(self, **data):
+            super().__init__(**data)
+            self._track_fields()
+
+        def _track_fields(self) -> None:
+            # Write through `__dict__` directly: the values are unchanged, so no change event is due.
+            for name in self.__fields__:
+                self.__dict__[name] = self._make_child_trackable(self.__dict__[name])
+
+        def _tracked_copy(self) -> Self:
+            """
+            Return a deep copy of this model, wrapped as a new tracked tree.
+
+            Unlike `parse_obj`, the (already validated) values are not validated again.
+            """
+            values = {k: _copy_for_tracking(v) for k, v in self.__dict__.items() if k != '_parents'}
+            new = self.__class__.construct(_fields_set=set(self.__fields_set__), **values)
+            new._track_fields()
+            return new
+
+        def __setattr__(self, name, value):
+            self._before_change()
+            prev_value = getattr(self, name, None)
+            super().__setattr__(name, value)
+            if name in self.__fields__:
+                self.__dict__[name] = self._make_child_trackable(self.__dict__[name])
+            # Even an equal value may be a different object, which the cached plain copy doesn't refer to.
+            _drop_serialized(id(self))
+            if prev_value != getattr(self, name):
+                self.changed()
+
+    def _copy_for_tracking(val: Any) -> Any:
+        if isinstance(val, TrackedPydanticBaseModel):
+            return val._tracked_copy()
+        if isinstance(val, dict):
+            return {k: _copy_for_tracking(v) for k, v in val.items()}
+        if isinstance(val, list):
+            return [_copy_for_tracking(o) for o in val]
+        return copy.deepcopy(val)
+
+    class PydanticType(sa.types.TypeDecorator, TypeEngine[_P]):
+        """
+        Inspired by https://gist.github.com/imankulov/4051b7805ad737ace7d8de3d3f934d6b
+
+        With `create_engine(json_serializer=json_serializer)`, tracked models are handed to the serializer as they are,
+        and encoded straight to JSON (reusing the fragments unchanged since the last flush), be it by SQLAlchemy
+        (e.g. for psycopg2 and asyncpg) or by the psycopg (3) dumpers, which SQLAlchemy configures with it.
+        A `functools.partial` or `functools.wraps` wrapper of `json_serializer` is recognized too. With any other
+        serializer (e.g. the default `json.dumps`), or a `sqltype` other than JSON, a plain copy is bound instead.
+        """
+        cache_ok = True
+        impl = sa.types.JSON
+
+        def __init__(
+            self, pydantic_type: type[_P], sqltype: TypeEngine[_T] = None, cache_size: int | None = None
+        ):
+            """
+            :param cache_size: If given, keep up to this many validated values (keyed by their raw payload)
+                in an LRU cache, so loading an identical document again skips validation.
+            """
+            super().__init__()
+            self.pydantic_type = pydantic_type
+            self.sqltype = sqltype
+            self.cache_size = cache_size
+            self._result_cache: LRUCache[_P] | None = None if cache_size is None else LRUCache(cache_size)
+
+        def load_dialect_impl(self, dialect):
+            from sqlalchemy.dialects.postgresql import JSONB
+
+            if self.sqltype is not None:
+                return dialect.type_descriptor(self.sqltype)
+
+            if dialect.name == "postgresql":
+                return dialect.type_descriptor(JSONB())
+            return dialect.type_descriptor(sa.JSON())
+
+        def __repr__(self):
+            # NOTE: the `__repr__` is used by Alembic to generate the migration script.
+            return f'PydanticType({self.pydantic_type.__name__})'
+
+        def process_bind_param(self, value, dialect):
+            if not value:
+                return None
+            if _serializes_models(dialect) and (self.sqltype is None or isinstance(self.sqltype, sa.JSON)):
+                # No need of the intermediate plain copy, `json_serializer` encodes models too.
+                return value
+            # Unlike `value.dict()`, this reuses the plain copies of subtrees unchanged since the last flush.
+            return TrackedObject.make_nested_plain(value)
+
+        def process_result_value(self, value, dialect) -> _P | None:
+            if value is None:
+                return None
+            if self._result_cache is None:
+                return pydantic.parse_obj_as(self.pydantic_type, value)
+
+            key = payload_key(value)
+            template = self._result_cache.get(key)
+            if template is None:
+                template = pydantic.parse_obj_as(self.pydantic_type, value)
+                self._result_cache.put(key, template)
+            # The cached template is never handed out, so it can't be mutated by its users.
+            if isinstance(template, TrackedPydanticBaseModel):
+                return template._tracked_copy()
+            return template.copy(deep=True)
+
+        def cache_info(self) -> CacheInfo | None:
+            """Return hit/miss statistics of the result cache, or None if caching is not enabled."""
+            return None if self._result_cache is None else self._result_cache.info()
+
+        def cache_clear(self) -> None:
+            if self._result_cache is not None:
+                self._result_cache.clear()
+
+    class MutablePydanticBaseModel(TrackedPydanticBaseModel, Mutable):
+        _restore_on_rollback: ClassVar[bool] = False
+
+        @classmethod
+        def coerce(cls, key, value) -> Self:
+            if isinstance(value, SerializedJSON):
+                # e.g. set on the loaded objects by a bulk UPDATE of `coerce_many(..., serialize=True)` values
+                value = value.decode()
+            if isinstance(value, cls):
+                return value
+            if type(value) is cls.__dict__.get('_options_base'):
+                # An instance of the model itself, of which `as_mutable` options derived `cls`, is taken as it is
+                # too. But its fields are tracked again under `cls`, as deep as the column tracks.
+                object.__setattr__(value, '__class__', cls)
+                value.__dict__.update((name, _copy_plain(value.__dict__[name])) for name in value.__fields__)
+                value._track_fields()
+                return value
+            return cls.parse_obj(value)
+
+        @classmethod
+        def coerce_many(
+            cls, values: Iterable[Any], serialize: bool = False
+        ) -> List[Optional[Self | SerializedJSON]]:
+            """
+            Coerce `values` in a single call, e.g. the column values of the parameter sets of an ORM bulk
+            INSERT / UPDATE, which don't go through `coerce` (hence validation) of the attribute events.
+            None is kept as it is.
+
+            The values which are not instances of `cls` yet are validated at once, as a `Dict[int, cls]`
+            keyed by their positions, which also locate them in a `ValidationError`.
+
+            :param serialize: If True, return the values encoded as JSON (see `SerializedJSON`), to be fed to
+                an engine created with `json_serializer=json_serializer`. The values are only validated then,
+                without building tracked models, which takes most of the time of coercion.
+            """
+            res = list(values)
+            # NOTE: Instances are not passed to pydantic, which would copy them.
+            to_validate = {i: v for i, v in enumerate(res) if v is not None and not isinstance(v, cls)}
+            if serialize and not (cls.__exclude_fields__ or cls.__include_fields__):
+                errors = []
+                for i, value in to_validate.items():
+                    try:
+                        value = value if isinstance(value, dict) else dict(value)
+                    except (TypeError, ValueError):
+                        # Located at the row, as when validating it as a `cls` below.
+                        errors.append(pydantic.error_wrappers.ErrorWrapper(pydantic.errors.DictError(), loc=i))
+                        continue
+                    fields, _, error = pydantic.validate_model(cls, value)
+                    if error is not None:
+                        errors.append(pydantic.error_wrappers.ErrorWrapper(error, loc=i))
+                    res[i] = fields
+                if errors:
+                    raise pydantic.ValidationError(errors, cls)
+                # The validated fields are plain values and untracked models, converted like `dict()` does.
+                return [None if v is None else SerializedJSON(json_serializer(TrackedObject.make_nested_plain(v)))
+                        for v in res]
+
+            if to_validate:
+                for i, model in pydantic.parse_obj_as(Dict[int, cls], to_validate).items():
+                    res[i] = model
+            if serialize:
+                return [None if v is None else SerializedJSON(json_serializer(v)) for v in res]
+            return res
+
+        def dict(self, *args, **kwargs):
+            res = super().dict(*args, **kwargs)
+            res.pop('_parents', None)
+            return res
+
+        @classmethod
+        def as_mutable(
+            cls,
+            sqltype: TypeEngine[_T] = None,
+            cache_size: int | None = None,
+            max_depth: int | None = None,
+            restore_on_rollback: bool = False,
+        ) -> TypeEngine[Self]:
+            """
+            :param cache_size: See `PydanticType`. Caching pays off for documents (e.g. configs, templates)
+                which are loaded over and over again.
+            :param max_depth: If given, only track mutations of this many levels (the model itself is level 1),
+                values below are copied as plain Python objects.
+            :param restore_on_rollback: If True, restore the value from an in-memory snapshot of the state this
+                session last loaded or committed when the session is rolled back, instead of reloading it from
+                the database. NOTE: Changes committed by other transactions meanwhile are not seen, and get
+                overwritten when the attribute is flushed again.
+            """
+            cls = _with_options(cls, max_depth=max_depth, restore_on_rollback=restore_on_rollback)
+            return super(MutablePydanticBaseModel, cls).as_mutable(PydanticType(cls, sqltype, cache_size=cache_size))
+
+        @classmethod
+        def associate_with_attribute(cls, attribute):
+            super().associate_with_attribute(attribute)
+            if cls._restore_on_rollback:
+                restore_on_rollback(cls, attribute)
+elif not TYPE_CHECKING:
+    class TrackedPydanticBaseModel:
+        def __new__(cls, *a, **k):
+            raise RuntimeError("pydantic is not installed!")
+
+    class PydanticType:
+        def __new__(cls, *a, **k):
+            raise RuntimeError("PydanticType requires pydantic to be installed")
+
+    class MutablePydanticBaseModel:
+        def __new__(cls, *a, **k):
+            raise RuntimeError("MutablePydanticBaseModel requires pydantic to be installed")
+
+# Keep the module paths the classes had before moving here, e.g. Alembic writes the module of `PydanticType`
+# into the generated migrations, which have to import it from a public place.
+TrackedPydanticBaseModel.__module__ = 'sqlalchemy_nested_mutable.trackable'
+PydanticType.__module__ = MutablePydanticBaseModel.__module__ = 'sqlalchemy_nested_mutable.mutable'
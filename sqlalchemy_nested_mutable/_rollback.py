@@ -0,0 +1,190 @@
+"""
+Restore mutable attributes in memory after a rollback, instead of reloading them from the database.
+
+Snapshots are taken when a value is loaded, and when it's committed unless the commit expires it.
+
+See the `restore_on_rollback` option of `as_mutable`.
+"""
+from __future__ import annotations
+
+from functools import partial
+from itertools import chain
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, Optional, Tuple
+from weakref import WeakKeyDictionary, WeakSet, ref
+
+from sqlalchemy import event
+from sqlalchemy.orm import InstanceState, Session, SessionTransaction
+from sqlalchemy.orm.attributes import QueryableAttribute, instance_state
+
+from .trackable import TrackedObject, before_change_hooks
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.mutable import Mutable
+
+
+class _Snapshot:
+    """
+    The value of a mutable attribute as the session last loaded or committed it.
+
+    It refers to the value object itself, until that value is about to be changed for the first time.
+    Only then a plain copy is taken, which shares the cached plain copies of the subtrees
+    (see `TrackedObject.make_nested_plain`).
+    """
+    __slots__ = ('mutable_cls', 'value', 'plain', 'loaded', 'hook', '__weakref__')
+
+    def __init__(self, mutable_cls: type[Mutable], value: Mutable):
+        self.mutable_cls = mutable_cls
+        self.value: Optional[Mutable] = value
+        self.plain: Any = None
+        # Whether the attribute was loaded when the transaction got rolled back.
+        self.loaded = True
+        # NOTE: The hook refers to the snapshot weakly, or it would keep the snapshot (and the value) alive
+        # after the instance is gone.
+        self.hook: Callable[[], None] = partial(_take, ref(self))
+        before_change_hooks[id(value)] = self.hook
+
+    def __del__(self):
+        self.discard()
+
+    def take(self) -> None:
+        if self.value is not None:
+            self.discard()
+            self.plain = TrackedObject.make_nested_plain(self.value)
+            self.value = None
+
+    def discard(self) -> None:
+        # The value may have got a newer snapshot (and hook) meanwhile.
+        if self.value is not None and before_change_hooks.get(id(self.value)) is self.hook:
+            del before_change_hooks[id(self.value)]
+
+    def restore(self, state: InstanceState, key: str) -> Mutable:
+        value = self.value if self.value is not None else self.mutable_cls.coerce(key, self.plain)
+        state.manager[key].impl.set_committed_value(state, state.dict, value)
+        value._parents[state] = key
+        return value
+
+
+def _take(snapshot_ref: ref[_Snapshot]) -> None:
+    if (snapshot := snapshot_ref()) is not None:
+        snapshot.take()
+
+
+snapshots: WeakKeyDictionary[InstanceState, Dict[str, _Snapshot]] = WeakKeyDictionary()
+# The attributes to restore on rollback: mapped class -> attribute key -> mutable class.
+restorable_attributes: Dict[type, Dict[str, type[Mutable]]] = {}
+
+
+def restore_on_rollback(mutable_cls: type[Mutable], attribute: QueryableAttribute) -> None:
+    """Keep snapshots of `attribute` (which is associated with `mutable_cls`) to restore it on rollback."""
+    key = attribute.key
+    restorable_attributes.setdefault(attribute.class_, {})[key] = mutable_cls
+    _listen_on_session()
+
+    def load(state: InstanceState, *args: Any) -> None:
+        state_snapshots = snapshots.setdefault(state, {})
+        if (snapshot := state_snapshots.get(key)) is not None:
+            if snapshot.value is None:
+                # Already changed in this transaction: the reloaded value may not be committed yet.
+                return
+            snapshot.discard()
+        if (value := state.dict.get(key)) is None:
+            state_snapshots.pop(key, None)
+        else:
+            state_snapshots[key] = _Snapshot(mutable_cls, value)
+            _track_state(state)
+
+    def load_attrs(state: InstanceState, ctx: Any, attrs: Any) -> None:
+        if not attrs or key in attrs:
+            load(state)
+
+    def set_(state: InstanceState, value: Any, oldvalue: Any, initiator: Any) -> None:
+        if value is not oldvalue and (snapshot := snapshots.get(state, {}).get(key)) is not None:
+            snapshot.take()
+
+    # NOTE: Listen after `Mutable`, whose listeners coerce the loaded values.
+    event.listen(attribute.class_, "load", load, raw=True, propagate=True)
+    event.listen(attribute.class_, "refresh", load_attrs, raw=True, propagate=True)
+    event.listen(attribute, "set", set_, raw=True, propagate=True)
+
+
+# The states of each session with snapshots, or with restorable values about to be committed,
+# not to scan the whole identity map at the end of each transaction.
+session_states: WeakKeyDictionary[Session, WeakSet[InstanceState]] = WeakKeyDictionary()
+
+
+def _track_state(state: InstanceState) -> None:
+    if (session := state.session) is not None:
+        session_states.setdefault(session, WeakSet()).add(state)
+
+
+def _restorable_attributes(state: InstanceState) -> Iterator[Tuple[str, type[Mutable]]]:
+    for class_ in state.class_.__mro__:
+        if (attrs := restorable_attributes.get(class_)) is not None:
+            yield from attrs.items()
+
+
+def _after_flush(session: Session, flush_context: Any) -> None:
+    # Still the pre-flush state, i.e. the states whose values get committed, see `_after_commit`.
+    for obj in chain(session.new, session.dirty):
+        state = instance_state(obj)
+        if any(_restorable_attributes(state)):
+            _track_state(state)
+
+
+def _after_commit(session: Session) -> None:
+    if session.in_nested_transaction():
+        # A released savepoint, its changes are not committed yet.
+        return
+    states = list(session_states.pop(session, ()))
+    if session.expire_on_commit:
+        # The commit is about to expire all the attributes, whose snapshots would never be restored,
+        # so drop them rather than keep the old values alive until the rows are reloaded.
+        for state in states:
+            for snapshot in snapshots.pop(state, {}).values():
+                snapshot.discard()
+        return
+    # Whatever is loaded now has just been committed.
+    for state in states:
+        state_snapshots = snapshots.setdefault(state, {})
+        for key, mutable_cls in _restorable_attributes(state):
+            value = state.dict.get(key)
+            if (snapshot := state_snapshots.get(key)) is not None and snapshot.value is value is not None:
+                continue  # Unchanged
+            if (snapshot := state_snapshots.pop(key, None)) is not None:
+                snapshot.discard()
+            if value is not None:
+                state_snapshots[key] = _Snapshot(mutable_cls, value)
+        if state_snapshots:
+            _track_state(state)
+
+
+def _after_rollback(session: Session) -> None:
+    # Fired before the rollback expires the attributes.
+    for state in list(session_states.get(session, ())):
+        for key, snapshot in snapshots.get(state, {}).items():
+            snapshot.loaded = key in state.dict
+
+
+def _after_soft_rollback(session: Session, previous_transaction: SessionTransaction) -> None:
+    if previous_transaction.nested:
+        # Snapshots are taken at transaction boundaries, not at savepoints.
+        return
+    for state in list(session_states.get(session, ())):
+        state_snapshots = snapshots.get(state, {})
+        for key, snapshot in list(state_snapshots.items()):
+            if snapshot.loaded and key not in state.dict:
+                value = snapshot.restore(state, key)
+                state_snapshots[key] = _Snapshot(snapshot.mutable_cls, value)
+
+
+_session_listened = False
+
+
+def _listen_on_session() -> None:
+    global _session_listened
+    if not _session_listened:
+        event.listen(Session, "after_flush", _after_flush)
+        event.listen(Session, "after_commit", _after_commit)
+        event.listen(Session, "after_rollback", _after_rollback)
+        event.listen(Session, "after_soft_rollback", _after_soft_rollback)
+        _session_listened = True
@@ -0,0 +1,118 @@
+"""
+Introspect the memory held by tracked values and the module-level registries behind them.
+
+    from sqlalchemy_nested_mutable.diagnostics import tracking_stats, root_sizes
+
+    print(tracking_stats())
+    for root in sorted(root_sizes(session), key=lambda r: r.size, reverse=True)[:10]:
+        print(root)
+
+See also `sqlalchemy_nested_mutable.testing.leaks` for a leak check to use in tests.
+"""
+from __future__ import annotations
+
+import gc
+import sys
+from typing import Any, List, NamedTuple
+
+from sqlalchemy import inspect
+from sqlalchemy.ext.mutable import Mutable
+from sqlalchemy.orm import Session
+
+from ._compat import is_pydantic_model
+from ._rollback import snapshots
+from .trackable import TrackedObject, before_change_hooks, json_cache, parents_track, plain_cache, tracked_model_classes
+
+
+class TrackingStats(NamedTuple):
+    # Tracked containers and models alive, roots (i.e. attribute values) included.
+    live_nodes: int
+    # Entries of the parent registry, one per tracked non-root node.
+    parent_links: int
+    # Generated `Tracked<Model>` classes.
+    tracked_model_classes: int
+    # Cached plain copies and JSON fragments, see `make_nested_plain` and `json_serializer`.
+    plain_cache: int
+    json_cache: int
+    # Snapshots kept for `restore_on_rollback`, and those yet to be taken.
+    rollback_snapshots: int
+    before_change_hooks: int
+
+
+def tracking_stats() -> TrackingStats:
+    """
+    Return the current sizes of the registries.
+
+    NOTE: Counting the live nodes scans all the objects tracked by the garbage collector,
+    so it's meant for diagnostics, not to be called on a hot path.
+    """
+    return TrackingStats(
+        live_nodes=sum(1 for o in gc.get_objects() if isinstance(o, TrackedObject)),
+        parent_links=len(parents_track),
+        tracked_model_classes=len(tracked_model_classes),
+        plain_cache=len(plain_cache),
+        json_cache=len(json_cache),
+        rollback_snapshots=sum(len(v) for v in list(snapshots.values())),
+        before_change_hooks=len(before_change_hooks),
+    )
+
+
+def estimate_size(value: Any) -> int:
+    """
+    Estimate the bytes held by `value` and everything it refers to: containers, models, keys and scalars,
+    plus the bookkeeping of its tracked nodes (parent links, cached plain copies and JSON fragments).
+
+    Objects referenced more than once (e.g. interned strings, or subtrees shared by copy-on-write containers)
+    are counted once.
+    """
+    seen = set()
+    total = 0
+    stack = [value]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+
+        # NOTE: Read the items the `dict`/`list` way, not to make shared copy-on-write children tracked.
+        if isinstance(obj, dict):
+            stack.extend(dict.keys(obj))
+            stack.extend(dict.values(obj))
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(list.__iter__(obj) if isinstance(obj, list) else obj)
+        elif is_pydantic_model(obj):
+            total += sys.getsizeof(obj.__dict__)
+            stack.extend(v for k, v in obj.__dict__.items() if k != '_parents')
+
+        if isinstance(obj, TrackedObject):
+            total += _bookkeeping_size(id(obj))
+    return total
+
+
+def _bookkeeping_size(id_: int) -> int:
+    size = 0
+    if (ref := parents_track.data.get(id_)) is not None:
+        size += sys.getsizeof(ref)
+    # The plain copies of the children are cached by the children, so they are counted there.
+    if (plain := plain_cache.get(id_)) is not None:
+        size += sys.getsizeof(plain)
+    if (fragment := json_cache.get(id_)) is not None:
+        size += sys.getsizeof(fragment)
+    return size
+
+
+class RootSize(NamedTuple):
+    instance: Any
+    key: str
+    size: int
+
+
+def root_sizes(session: Session) -> List[RootSize]:
+    """Return the estimated size (see `estimate_size`) of each loaded mutable attribute in `session`."""
+    return [
+        RootSize(instance, key, estimate_size(value))
+        for instance in list(session)
+        for key, value in inspect(instance).dict.items()
+        if isinstance(value, TrackedObject) and isinstance(value, Mutable)
+    ]
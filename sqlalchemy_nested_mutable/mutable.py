@@ -1,20 +1,103 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, List, Iterable, TypeVar
+from typing import Any, List, Iterable, Optional, TypeVar
 from typing_extensions import Self
 
-import sqlalchemy as sa
 from sqlalchemy.ext.mutable import Mutable
 from sqlalchemy.sql.type_api import TypeEngine
 
-from .trackable import TrackedObject, TrackedList, TrackedDict, TrackedPydanticBaseModel
+from .trackable import (
+    TrackedList, TrackedDict, CopyOnWriteTrackedList, CopyOnWriteTrackedDict, SerializedJSON, json_serializer
+)
+from ._rollback import restore_on_rollback
 from ._typing import _T
-from ._compat import pydantic
 
-_P = TypeVar("_P", bound='MutablePydanticBaseModel')
+_M = TypeVar("_M", bound=Mutable)
+
+
+def _with_options(
+    cls: type[_M], max_depth: int | None = None, restore_on_rollback: bool = False, copy_on_write: bool = False
+) -> type[_M]:
+    """Derive a subclass of `cls` with the given `as_mutable` options, if any of them is not the default."""
+    bases: tuple[type, ...] = (cls,)
+    if copy_on_write:
+        bases = (CopyOnWriteTrackedDict if issubclass(cls, dict) else CopyOnWriteTrackedList, cls)
+    options = {}
+    if max_depth is not None:
+        if max_depth < 1:
+            raise ValueError("max_depth must be a positive integer")
+        options['_max_depth'] = max_depth
+    if restore_on_rollback:
+        options['_restore_on_rollback'] = True
+    if bases == (cls,) and not options:
+        return cls
+    return type(cls.__name__, bases, {
+        '__module__': cls.__module__,
+        '__qualname__': cls.__qualname__,
+        '__doc__': cls.__doc__,
+        '_options_base': cls,
+        **options,
+    })
+
+
+class _MutableContainer(Mutable):
+    """The `Mutable` part shared by `MutableList` and `MutableDict`, `as_mutable` options included."""
+    _restore_on_rollback: bool = False
 
+    @classmethod
+    def coerce(cls, key, value):
+        if isinstance(value, SerializedJSON):
+            # e.g. set on the loaded objects by a bulk UPDATE of `coerce_many(..., serialize=True)` values
+            value = value.decode()
+        return value if isinstance(value, cls) else cls(value)
 
-class MutableList(TrackedList, Mutable, List[_T]):
+    @classmethod
+    def coerce_many(cls, values: Iterable[Any], serialize: bool = False) -> List[Optional[Self | SerializedJSON]]:
+        """
+        Coerce `values` in a single call, e.g. the column values of the parameter sets of an ORM bulk
+        INSERT / UPDATE, which don't go through `coerce` of the attribute events. None is kept as it is.
+
+        :param serialize: If True, return the values encoded as JSON (see `SerializedJSON`), to be fed to an
+            engine created with `json_serializer=json_serializer`.
+        """
+        if serialize:
+            # Plain values are encoded as they are, without building tracked containers first.
+            return [None if v is None else SerializedJSON(json_serializer(v)) for v in values]
+        return [None if v is None else cls.coerce(None, v) for v in values]
+
+    @classmethod
+    def as_mutable(
+        cls,
+        sqltype: TypeEngine[_T],
+        max_depth: int | None = None,
+        restore_on_rollback: bool = False,
+        copy_on_write: bool = False,
+    ) -> TypeEngine[_T]:
+        """
+        :param max_depth: If given, only track mutations of this many levels (the list/dict itself is level 1),
+            values below are copied as plain Python objects.
+        :param restore_on_rollback: If True, restore the value from an in-memory snapshot of the state this session
+            last loaded or committed when the session is rolled back, instead of reloading it from the database.
+            NOTE: Changes committed by other transactions meanwhile are not seen, and get overwritten when
+            the attribute is flushed again.
+        :param copy_on_write: If True, nested containers are shared with the assigned (or loaded) value,
+            and only copied into tracked containers when accessed. See `CopyOnWriteTrackedObject`.
+            Requires `create_engine(json_serializer=json_serializer)` for JSON columns, otherwise
+            the first flush copies all of them.
+        """
+        cls = _with_options(
+            cls, max_depth=max_depth, restore_on_rollback=restore_on_rollback, copy_on_write=copy_on_write
+        )
+        return super(_MutableContainer, cls).as_mutable(sqltype)
+
+    @classmethod
+    def associate_with_attribute(cls, attribute):
+        super().associate_with_attribute(attribute)
+        if cls._restore_on_rollback:
+            restore_on_rollback(cls, attribute)
+
+
+class MutableList(TrackedList, _MutableContainer, List[_T]):
     """
     A mutable list that tracks changes to itself and its children.
 
@@ -23,74 +106,18 @@ class MutableList(TrackedList, Mutable, List[_T]):
         aliases: Mapped[list[str]] = mapped_column(MutableList.as_mutable(ARRAY(String(128))))
         schedule: Mapped[list[list[str]]] = mapped_column(MutableList.as_mutable(ARRAY(sa.String(128), dimensions=2)))
     """
-    @classmethod
-    def coerce(cls, key, value):
-        return value if isinstance(value, cls) else cls(value)
-
     def __init__(self, __iterable: Iterable[_T]):
-        super().__init__(TrackedObject.make_nested_trackable(__iterable, self))
+        super().__init__(self._make_child_trackable(o) for o in __iterable)
 
 
-class MutableDict(TrackedDict, Mutable):
-    @classmethod
-    def coerce(cls, key, value):
-        return value if isinstance(value, cls) else cls(value)
-
+class MutableDict(TrackedDict, _MutableContainer):
     def __init__(self, source=(), **kwds):
-        super().__init__(TrackedObject.make_nested_trackable(dict(source, **kwds), self))
+        super().__init__((k, self._make_child_trackable(v)) for k, v in dict(source, **kwds).items())
 
 
-if pydantic is not None:
-    class PydanticType(sa.types.TypeDecorator, TypeEngine[_P]):
-        """
-        Inspired by https://gist.github.com/imankulov/4051b7805ad737ace7d8de3d3f934d6b
-        """
-        cache_ok = True
-        impl = sa.types.JSON
-
-        def __init__(self, pydantic_type: type[_P], sqltype: TypeEngine[_T] = None):
-            super().__init__()
-            self.pydantic_type = pydantic_type
-            self.sqltype = sqltype
-
-        def load_dialect_impl(self, dialect):
-            from sqlalchemy.dialects.postgresql import JSONB
-
-            if self.sqltype is not None:
-                return dialect.type_descriptor(self.sqltype)
-
-            if dialect.name == "postgresql":
-                return dialect.type_descriptor(JSONB())
-            return dialect.type_descriptor(sa.JSON())
-
-        def __repr__(self):
-            # NOTE: the `__repr__` is used by Alembic to generate the migration script.
-            return f'PydanticType({self.pydantic_type.__name__})'
-
-        def process_bind_param(self, value, dialect):
-            return value.dict() if value else None
-
-        def process_result_value(self, value, dialect) -> _P | None:
-            return None if value is None else pydantic.parse_obj_as(self.pydantic_type, value)
-
-    class MutablePydanticBaseModel(TrackedPydanticBaseModel, Mutable):
-        @classmethod
-        def coerce(cls, key, value) -> Self:
-            return value if isinstance(value, cls) else cls.parse_obj(value)
-
-        def dict(self, *args, **kwargs):
-            res = super().dict(*args, **kwargs)
-            res.pop('_parents', None)
-            return res
-
-        @classmethod
-        def as_mutable(cls, sqltype: TypeEngine[_T] = None) -> TypeEngine[Self]:
-            return super().as_mutable(PydanticType(cls, sqltype))
-elif not TYPE_CHECKING:
-    class PydanticType:
-        def __new__(cls, *a, **k):
-            raise RuntimeError("PydanticType requires pydantic to be installed")
-
-    class MutablePydanticBaseModel:
-        def __new__(cls, *a, **k):
-            raise RuntimeError("MutablePydanticBaseModel requires pydantic to be installed")
+def __getattr__(name: str) -> Any:
+    # The pydantic-backed types used to live here, and are imported on first access to defer importing pydantic.
+    if name in ('PydanticType', 'MutablePydanticBaseModel'):
+        from . import _pydantic
+        return getattr(_pydantic, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
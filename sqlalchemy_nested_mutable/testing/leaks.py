@@ -0,0 +1,46 @@
+import gc
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from sqlalchemy_nested_mutable.diagnostics import tracking_stats
+
+PACKAGE_DIR = str(Path(__file__).parent.parent)
+
+
+@contextmanager
+def check_no_leaks(max_leaked_bytes: int = 0) -> Iterator[None]:
+    """
+    Assert that the code in the block leaves no tracked nodes or registry entries behind,
+    and at most `max_leaked_bytes` allocated by this package, once garbage is collected.
+
+    Everything the block keeps (e.g. sessions, instances, values) has to be released before it ends.
+    NOTE: Warm up first, since the first use of a type allocates things meant to stay, e.g. `Tracked<Model>` classes.
+    The registries are dicts, which keep their capacity when emptied, so allow a few KiB for them to grow.
+    """
+    gc.collect()
+    stats_before = tracking_stats()
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    snapshot_before = tracemalloc.take_snapshot()
+    try:
+        yield
+        gc.collect()
+        snapshot_after = tracemalloc.take_snapshot()
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+
+    stats_after = tracking_stats()
+    assert stats_after == stats_before, f"Tracking leaked: {stats_before} -> {stats_after}"
+
+    package_only = [tracemalloc.Filter(True, f"{PACKAGE_DIR}/*")]
+    diffs = snapshot_after.filter_traces(package_only).compare_to(
+        snapshot_before.filter_traces(package_only), 'lineno'
+    )
+    leaked = sum(d.size_diff for d in diffs)
+    assert leaked <= max_leaked_bytes, "Leaked {} bytes:\n{}".format(
+        leaked, '\n'.join(str(d) for d in diffs[:10] if d.size_diff > 0)
+    )
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Optional, Union, Any, Tuple, Dict, List, Iterable, overload
+import json
+from json.encoder import encode_basestring_ascii
+from typing import TYPE_CHECKING, Callable, Optional, Union, Any, Tuple, Dict, List, Iterable, overload
 from typing_extensions import Self
 from weakref import WeakValueDictionary
 
@@ -8,9 +10,19 @@ from sqlalchemy.util.typing import SupportsIndex, TypeGuard
 from sqlalchemy.ext.mutable import Mutable
 
 from ._typing import _T, _KT, _VT
-from ._compat import pydantic
+from ._compat import imported_pydantic, is_pydantic_model
 
 parents_track: WeakValueDictionary[int, object] = WeakValueDictionary()
+# The generated `Tracked<Model>` classes, keyed by (model class, max depth).
+tracked_model_classes: Dict[Tuple[type, Optional[int]], type] = {}
+# Plain copies (see `make_nested_plain`) and JSON fragments (see `json_serializer`) of tracked objects,
+# dropped as soon as the object changes.
+plain_cache: Dict[int, Any] = {}
+json_cache: Dict[int, str] = {}
+# One-shot callbacks to run right before an object (or any of its descendants) is changed for the first time.
+before_change_hooks: Dict[int, Callable[[], None]] = {}
+
+_MISSING: Any = object()
 
 
 class TrackedObject:
@@ -19,38 +31,266 @@ class TrackedObject:
 
     The top object in the parent link should be an instance of `Mutable`.
     """
+    # How many levels (this object included) are tracked from here on, None for unlimited.
+    _max_depth: Optional[int] = None
+
     def __del__(self):
         if (id_ := id(self)) in parents_track:
             del parents_track[id_]
+        _drop_serialized(id_)
+        before_change_hooks.pop(id_, None)
+
+    def _before_change(self):
+        if not before_change_hooks:
+            return
+        node: Any = self
+        while node is not None:
+            if (hook := before_change_hooks.pop(id(node), None)) is not None:
+                hook()
+                return
+            node = parents_track.get(id(node))
 
     def changed(self):
+        _drop_serialized(id(self))
         if (id_ := id(self)) in parents_track:
             parent = parents_track[id_]
             parent.changed()
         elif isinstance(self, Mutable):
             super().changed()
 
+    @property
+    def _child_max_depth(self) -> Optional[int]:
+        return None if self._max_depth is None else self._max_depth - 1
+
+    def _make_child_trackable(self, val: _T) -> _T:
+        return TrackedObject.make_nested_trackable(val, self, self._child_max_depth)
+
     @classmethod
-    def make_nested_trackable(cls, val: _T, parent: Mutable):
+    def make_nested_trackable(cls, val: _T, parent: Mutable, max_depth: Optional[int] = None):
+        """
+        Wrap `val` (and its children, recursively) into tracked objects.
+
+        :param max_depth: How many levels to track, starting from `val`. Values below are copied as plain objects.
+        """
+        if max_depth is not None and max_depth <= 0:
+            # Still copied like the tracked levels are, not to share them with the assigned value.
+            return _copy_plain(val)
+
         new_val: Any = val
+        child_max_depth = None if max_depth is None else max_depth - 1
 
+        # Children link to their immediate container, so a change can be traced along the path to the root.
         if isinstance(val, dict):
-            new_val = TrackedDict((k, cls.make_nested_trackable(v, parent)) for k, v in val.items())
-        elif isinstance(val, list):
-            new_val = TrackedList(cls.make_nested_trackable(o, parent) for o in val)
-        elif isinstance(val, pydantic.BaseModel) and not isinstance(val, TrackedPydanticBaseModel):
-            model_cls = type('Tracked' + val.__class__.__name__, (TrackedPydanticBaseModel, val.__class__), {})
-            model_cls.__doc__ = (
-                f"This class is composed of `{val.__class__.__name__}` and `TrackedPydanticBaseModel` "
-                "to make it trackable in nested context."
+            new_val = TrackedDict()
+            dict.update(
+                new_val, ((k, cls.make_nested_trackable(v, new_val, child_max_depth)) for k, v in val.items())
             )
-            new_val = model_cls.parse_obj(val.dict())  # type: ignore
+        elif isinstance(val, list):
+            new_val = TrackedList()
+            list.extend(new_val, (cls.make_nested_trackable(o, new_val, child_max_depth) for o in val))
+        elif is_pydantic_model(val) and not isinstance(val, TrackedObject):
+            model_cls = cls._get_tracked_model_class(val.__class__, max_depth)
+            new_val = model_cls.parse_obj(val.dict())
 
         if isinstance(new_val, cls):
             parents_track[id(new_val)] = parent
+            if max_depth is not None and isinstance(new_val, (TrackedDict, TrackedList)):
+                new_val._max_depth = max_depth
 
         return new_val
 
+    @staticmethod
+    def _get_tracked_model_class(model_cls: type, max_depth: Optional[int]) -> type:
+        from ._pydantic import TrackedPydanticBaseModel
+
+        if (tracked_cls := tracked_model_classes.get((model_cls, max_depth))) is None:
+            tracked_cls = type(
+                'Tracked' + model_cls.__name__,
+                (TrackedPydanticBaseModel, model_cls),
+                {'__module__': model_cls.__module__, '_max_depth': max_depth, '_untracked_cls': model_cls},
+            )
+            tracked_cls.__doc__ = (
+                f"This class is composed of `{model_cls.__name__}` and `TrackedPydanticBaseModel` "
+                "to make it trackable in nested context."
+            )
+            tracked_model_classes[(model_cls, max_depth)] = tracked_cls
+        return tracked_cls
+
+    @classmethod
+    def make_nested_plain(cls, val: Any) -> Any:
+        """
+        The reverse of `make_nested_trackable`: convert `val` into builtin containers in a single pass,
+        e.g. for serialization.
+
+        Pydantic models are converted like `BaseModel.dict()` does, without the tracking attributes.
+        The result of a tracked object is cached and reused until it (or any of its descendants) changes,
+        so the returned value must be treated as read-only.
+        """
+        return _make_plain(val)[0]
+
+
+def _copy_plain(val: Any) -> Any:
+    if isinstance(val, dict):
+        return {k: _copy_plain(v) for k, v in dict.items(val)}
+    if isinstance(val, list):
+        return [_copy_plain(o) for o in list.__iter__(val)]
+    if is_pydantic_model(val):
+        if not isinstance(val, TrackedObject):
+            return val.copy(deep=True)
+        if (untracked_cls := getattr(val, '_untracked_cls', None)) is None:
+            # e.g. a `MutablePydanticBaseModel`, copied without its links to the tree it belongs to.
+            return val._tracked_copy()
+        values = {k: _copy_plain(v) for k, v in val.__dict__.items() if k != '_parents'}
+        return untracked_cls.construct(_fields_set=set(val.__fields_set__), **values)
+    return val
+
+
+def _drop_serialized(id_: int) -> None:
+    plain_cache.pop(id_, None)
+    json_cache.pop(id_, None)
+
+
+def _make_plain(val: Any) -> Tuple[Any, bool]:
+    """Return the plain version of `val`, and whether it stays valid as long as `val` is not changed."""
+    tracked = isinstance(val, TrackedObject)
+    if tracked and (res := plain_cache.get(id(val), _MISSING)) is not _MISSING:
+        return res, True
+
+    # NOTE: The items are accessed the `dict`/`list` way, not to make the shared children of
+    # copy-on-write containers tracked, which are referenced as they are never changed in place.
+    shared = _shares_children(val)
+    if isinstance(val, dict):
+        res, cacheable = {}, tracked
+        for k, v in dict.items(val):
+            if shared and _is_shared(v):
+                res[k] = v
+                continue
+            res[k], cacheable_v = _make_plain(v)
+            cacheable = cacheable and cacheable_v
+    elif isinstance(val, (list, tuple)):
+        items, cacheable = [], tracked
+        for o in (list.__iter__(val) if isinstance(val, list) else val):
+            if not (shared and _is_shared(o)):
+                o, cacheable_o = _make_plain(o)
+                cacheable = cacheable and cacheable_o
+            items.append(o)
+        res = items if isinstance(val, list) else tuple(items)
+    elif is_pydantic_model(val):
+        if val.__exclude_fields__ or val.__include_fields__:
+            res = val.dict()
+            res.pop('_parents', None)
+            return res, False
+        res, cacheable = {}, tracked
+        for k, v in val.__dict__.items():
+            if k != '_parents':
+                res[k], cacheable_v = _make_plain(v)
+                cacheable = cacheable and cacheable_v
+    else:
+        # Scalars are referenced, not copied.
+        return val, True
+
+    if cacheable:
+        plain_cache[id(val)] = res
+    return res, cacheable
+
+
+def json_serializer(obj: Any) -> str:
+    """
+    A drop-in replacement of `json.dumps`, meant for `create_engine(json_serializer=json_serializer)`.
+
+    The JSON fragment of each tracked container is cached and reused until it (or any of its descendants)
+    changes, so re-serializing a large document after a small edit only re-encodes the path to the edit.
+
+    A `SerializedJSON` is passed through as it is.
+    """
+    if isinstance(obj, SerializedJSON):
+        return obj.text
+    return _dump_json(obj)[0]
+
+
+class SerializedJSON:
+    """
+    A value already encoded as JSON, e.g. by `coerce_many(..., serialize=True)`.
+
+    Only `json_serializer` knows it, other serializers (e.g. the default `json.dumps`) fail on it
+    rather than encoding it again as a JSON string.
+    """
+    __slots__ = ('text',)
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.text!r})'
+
+    def decode(self) -> Any:
+        return json.loads(self.text)
+
+
+def _json_compound_types() -> Tuple[type, ...]:
+    if (pydantic := imported_pydantic()) is not None:
+        return (dict, list, tuple, pydantic.BaseModel)
+    return (dict, list, tuple)
+
+
+def _dump_json_key(key: Any) -> str:
+    # Non-string keys are coerced the same way as `json.dumps` does.
+    return encode_basestring_ascii(key if isinstance(key, str) else json.dumps(key))
+
+
+def _dump_json(val: Any) -> Tuple[str, bool]:
+    """Return the JSON text of `val`, and whether it stays valid as long as `val` is not changed."""
+    if not isinstance(val, TrackedObject):
+        if isinstance(val, str):
+            return encode_basestring_ascii(val), True
+        if is_pydantic_model(val):
+            return json.dumps(_make_plain(val)[0]), False
+        # NOTE: Untracked containers may be mutated without notice, so they are never cached.
+        return json.dumps(val), not isinstance(val, (dict, list, tuple))
+    is_model = not isinstance(val, (dict, list))
+    if is_model and (val.__exclude_fields__ or val.__include_fields__):
+        return json.dumps(_make_plain(val)[0]), False
+
+    if (res := json_cache.get(id(val))) is not None:
+        return res, True
+
+    compound_types = _json_compound_types()
+    if not is_model and not any(
+        isinstance(o, compound_types) for o in (dict.values(val) if isinstance(val, dict) else list.__iter__(val))
+    ):
+        # A container of scalars only is encoded as a whole, at the speed of the C encoder.
+        res = json_cache[id(val)] = json.dumps(val)
+        return res, True
+
+    cacheable, shared = True, _shares_children(val)
+    if not isinstance(val, list):
+        items = dict.items(val) if isinstance(val, dict) else (
+            (k, v) for k, v in val.__dict__.items() if k != '_parents'
+        )
+        parts = []
+        for k, v in items:
+            if shared and _is_shared(v):
+                v = json.dumps(v)
+            else:
+                v, cacheable_v = _dump_json(v)
+                cacheable = cacheable and cacheable_v
+            parts.append(f'{_dump_json_key(k)}: {v}')
+        res = '{' + ', '.join(parts) + '}'
+    else:
+        parts = []
+        for o in list.__iter__(val):
+            if shared and _is_shared(o):
+                o = json.dumps(o)
+            else:
+                o, cacheable_o = _dump_json(o)
+                cacheable = cacheable and cacheable_o
+            parts.append(o)
+        res = '[' + ', '.join(parts) + ']'
+
+    if cacheable:
+        json_cache[id(val)] = res
+    return res, cacheable
+
 
 class TrackedList(TrackedObject, List[_T]):
     def __reduce_ex__(
@@ -73,48 +313,68 @@ class TrackedList(TrackedObject, List[_T]):
         self, index: SupportsIndex | slice, value: _T | Iterable[_T]
     ) -> None:
         """Detect list set events and emit change events."""
-        super().__setitem__(index, TrackedObject.make_nested_trackable(value, self))
+        self._before_change()
+        if isinstance(index, slice):
+            value = [self._make_child_trackable(v) for v in value]  # type: ignore
+        else:
+            value = self._make_child_trackable(value)
+        super().__setitem__(index, value)
         self.changed()
 
     def __delitem__(self, index: SupportsIndex | slice) -> None:
         """Detect list del events and emit change events."""
+        self._before_change()
         super().__delitem__(index)
         self.changed()
 
     def pop(self, *arg: SupportsIndex) -> _T:
+        self._before_change()
         result = super().pop(*arg)
         self.changed()
         return result
 
     def append(self, x: _T) -> None:
-        super().append(TrackedObject.make_nested_trackable(x, self))
+        self._before_change()
+        super().append(self._make_child_trackable(x))
         self.changed()
 
     def extend(self, x: Iterable[_T]) -> None:
-        super().extend(x)
+        self._before_change()
+        super().extend(self._make_child_trackable(v) for v in x)
         self.changed()
 
     def __iadd__(self, x: Iterable[_T]) -> Self:  # type: ignore
-        self.extend(TrackedObject.make_nested_trackable(v, self) for v in x)
+        self.extend(x)
+        return self
+
+    def __imul__(self, n: SupportsIndex) -> Self:
+        self._before_change()
+        super().__imul__(n)
+        self.changed()
         return self
 
     def insert(self, i: SupportsIndex, x: _T) -> None:
-        super().insert(i, TrackedObject.make_nested_trackable(x, self))
+        self._before_change()
+        super().insert(i, self._make_child_trackable(x))
         self.changed()
 
     def remove(self, i: _T) -> None:
+        self._before_change()
         super().remove(i)
         self.changed()
 
     def clear(self) -> None:
+        self._before_change()
         super().clear()
         self.changed()
 
     def sort(self, **kw: Any) -> None:
+        self._before_change()
         super().sort(**kw)
         self.changed()
 
     def reverse(self) -> None:
+        self._before_change()
         super().reverse()
         self.changed()
 
@@ -122,7 +382,8 @@ class TrackedList(TrackedObject, List[_T]):
 class TrackedDict(TrackedObject, Dict[_KT, _VT]):
     def __setitem__(self, key: _KT, value: _VT) -> None:
         """Detect dictionary set events and emit change events."""
-        super().__setitem__(key, value)
+        self._before_change()
+        super().__setitem__(key, self._make_child_trackable(value))
         self.changed()
 
     if TYPE_CHECKING:
@@ -144,21 +405,26 @@ class TrackedDict(TrackedObject, Dict[_KT, _VT]):
     else:
 
         def setdefault(self, key, value=None):  # noqa: F811
-            result = super().setdefault(key, value=TrackedObject.make_nested_trackable(value, self))
+            self._before_change()
+            result = super().setdefault(key, self._make_child_trackable(value))
             self.changed()
             return result
 
     def __delitem__(self, key: _KT) -> None:
         """Detect dictionary del events and emit change events."""
+        self._before_change()
         super().__delitem__(key)
         self.changed()
 
     def update(self, *a: Any, **kw: _VT) -> None:
-        a = tuple(TrackedObject.make_nested_trackable(e, self) for e in a)
-        kw = {k: TrackedObject.make_nested_trackable(v, self) for k, v in kw.items()}
-        super().update(*a, **kw)
+        self._before_change()
+        super().update((k, self._make_child_trackable(v)) for k, v in dict(*a, **kw).items())
         self.changed()
 
+    def __ior__(self, other: Any) -> Self:  # type: ignore
+        self.update(other)
+        return self
+
     if TYPE_CHECKING:
 
         @overload
@@ -177,16 +443,19 @@ class TrackedDict(TrackedObject, Dict[_KT, _VT]):
     else:
 
         def pop(self, *arg):  # noqa: F811
+            self._before_change()
             result = super().pop(*arg)
             self.changed()
             return result
 
     def popitem(self) -> Tuple[_KT, _VT]:
+        self._before_change()
         result = super().popitem()
         self.changed()
         return result
 
     def clear(self) -> None:
+        self._before_change()
         super().clear()
         self.changed()
 
@@ -196,27 +465,136 @@ class TrackedDict(TrackedObject, Dict[_KT, _VT]):
         self.update(state)
 
 
-if pydantic is not None:
-    class TrackedPydanticBaseModel(TrackedObject, Mutable, pydantic.BaseModel):
-        @classmethod
-        def coerce(cls, key, value):
-            return value if isinstance(value, cls) else cls.parse_obj(value)
-
-        def __init__(self, **data):
-            super().__init__(**data)
-            for field in self.__fields__.values():
-                setattr(
-                    self,
-                    field.name,
-                    TrackedObject.make_nested_trackable(getattr(self, field.name), self)
-                )
-
-        def __setattr__(self, name, value):
-            prev_value = getattr(self, name, None)
-            super().__setattr__(name, value)
-            if prev_value != getattr(self, name):
-                self.changed()
-elif not TYPE_CHECKING:
-    class TrackedPydanticBaseModel:
-        def __new__(cls, *a, **k):
-            raise RuntimeError("pydantic is not installed!")
+class CopyOnWriteTrackedObject(TrackedObject):
+    """
+    A tracked container which shares its child containers with the value it was created from,
+    e.g. a common template of many rows, instead of deep-copying them.
+
+    A shared child is kept as a plain `dict`/`list` which is never changed in place. Only when it is
+    accessed, it is copied into a tracked (copy-on-write) container, whose own children are still shared.
+    So creating a large value is cheap, and only the paths actually accessed get copied.
+
+    NOTE: The value a copy-on-write container is created from (or assigned) must not be changed in place
+    afterwards, since its subtrees may be shared.
+
+    NOTE: Serialize with `json_serializer`, which reads the shared children without copying them.
+    `json.dumps` (the default `json_serializer` of engines) reads a `dict` subclass through `items()`,
+    so it would copy every shared child.
+    """
+    def _make_child_trackable(self, val: _T) -> _T:
+        if isinstance(val, (dict, list)):
+            # NOTE: The plain copy of a tracked value is never changed in place either.
+            return TrackedObject.make_nested_plain(val) if isinstance(val, TrackedObject) else val
+        return super()._make_child_trackable(val)
+
+    def _tracked_child(self, val: _T) -> _T:
+        """Return a tracked copy of the child `val` if it is shared, or `val` as is."""
+        if not (_is_shared(val) and _shares_children(self)):
+            return val
+        new_val: Any
+        if isinstance(val, dict):
+            new_val = CopyOnWriteTrackedDict()
+            dict.update(new_val, val)
+        else:
+            new_val = CopyOnWriteTrackedList()
+            list.extend(new_val, val)
+        parents_track[id(new_val)] = self
+        if (max_depth := self._child_max_depth) is not None:
+            new_val._max_depth = max_depth
+        return new_val
+
+
+def _is_shared(val: Any) -> bool:
+    return isinstance(val, (dict, list)) and not isinstance(val, TrackedObject)
+
+
+def _shares_children(val: Any) -> bool:
+    """Whether the plain containers in `val` are shared, rather than being left untracked by `max_depth`."""
+    return isinstance(val, CopyOnWriteTrackedObject) and (val._max_depth is None or val._max_depth > 1)
+
+
+class CopyOnWriteTrackedList(CopyOnWriteTrackedObject, TrackedList[_T]):
+    def _track_all(self) -> None:
+        for i, val in enumerate(list.__iter__(self)):
+            if (new_val := self._tracked_child(val)) is not val:
+                list.__setitem__(self, i, new_val)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            self._track_all()
+            return super().__getitem__(index)
+        val = super().__getitem__(index)
+        if (new_val := self._tracked_child(val)) is not val:
+            list.__setitem__(self, index, new_val)
+        return new_val
+
+    def __iter__(self):
+        self._track_all()
+        return super().__iter__()
+
+    def __reversed__(self):
+        self._track_all()
+        return super().__reversed__()
+
+    def pop(self, *arg: SupportsIndex) -> _T:
+        return self._tracked_child(super().pop(*arg))
+
+    def copy(self) -> List[_T]:
+        self._track_all()
+        return super().copy()
+
+
+class CopyOnWriteTrackedDict(CopyOnWriteTrackedObject, TrackedDict[_KT, _VT]):
+    def _track_all(self) -> None:
+        for key, val in dict.items(self):
+            if (new_val := self._tracked_child(val)) is not val:
+                dict.__setitem__(self, key, new_val)
+
+    def __getitem__(self, key: _KT) -> _VT:
+        val = super().__getitem__(key)
+        if (new_val := self._tracked_child(val)) is not val:
+            dict.__setitem__(self, key, new_val)
+        return new_val
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    # NOTE: Overriding `__iter__` also makes `dict(d)` and `{**d}` go through `__getitem__`.
+    def __iter__(self):
+        return super().__iter__()
+
+    def values(self):
+        self._track_all()
+        return super().values()
+
+    def items(self):
+        self._track_all()
+        return super().items()
+
+    def setdefault(self, key, value=None):
+        if key not in self:
+            super().setdefault(key, value)
+        # A shared child is handed out as a tracked copy, even the one just inserted.
+        return self[key]
+
+    def pop(self, key, *default):
+        if key not in self:
+            # Raises, or returns the default which is not a child.
+            return super().pop(key, *default)
+        return self._tracked_child(super().pop(key))
+
+    def popitem(self) -> Tuple[_KT, _VT]:
+        key, val = super().popitem()
+        return key, self._tracked_child(val)
+
+    def copy(self) -> Dict[_KT, _VT]:
+        self._track_all()
+        return super().copy()
+
+
+def __getattr__(name: str) -> Any:
+    # `TrackedPydanticBaseModel` used to live here, and is imported on first access to defer importing pydantic.
+    if name == 'TrackedPydanticBaseModel':
+        from ._pydantic import TrackedPydanticBaseModel
+        return TrackedPydanticBaseModel
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
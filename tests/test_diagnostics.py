@@ -0,0 +1,87 @@
+from typing import List
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column
+
+from sqlalchemy_nested_mutable import MutableDict, MutablePydanticBaseModel
+from sqlalchemy_nested_mutable._compat import pydantic
+from sqlalchemy_nested_mutable.diagnostics import estimate_size, root_sizes, tracking_stats
+from sqlalchemy_nested_mutable.testing.leaks import check_no_leaks
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class Addresses(MutablePydanticBaseModel):
+    class AddressItem(pydantic.BaseModel):
+        street: str
+        tags: List[str] = []
+
+    home: List[AddressItem] = []
+
+
+class Profile(Base):
+    __tablename__ = "profile_diagnostics"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    settings = mapped_column(MutableDict.as_mutable(JSONB), default=dict)
+    settings_restorable = mapped_column(MutableDict.as_mutable(JSONB, restore_on_rollback=True), default=dict)
+    addresses: Mapped[Addresses] = mapped_column(Addresses.as_mutable(), nullable=True)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def _with_tables(session):
+    Base.metadata.create_all(session.bind)
+    yield
+    session.execute(sa.text("""
+    DROP TABLE profile_diagnostics CASCADE;
+    """))
+    session.commit()
+
+
+def _use_profiles(bind):
+    with Session(bind) as session:
+        session.add_all(Profile(
+            settings={"theme": {"colors": ["red", "blue"]}, "n": i},
+            settings_restorable={"a": {"b": [i]}},
+            addresses={"home": [{"street": f"{i} Main Street", "tags": ["x"]}]},
+        ) for i in range(20))
+        session.commit()
+
+        for profile in session.scalars(sa.select(Profile)):
+            profile.settings["theme"]["colors"].append("green")
+            profile.settings_restorable["a"]["b"].append(0)
+            profile.addresses.home[0].tags.append("y")
+        session.flush()
+        session.rollback()
+        session.execute(sa.delete(Profile))
+        session.commit()
+
+
+def test_diagnostics(session):
+    session.add(p := Profile(settings={"theme": {"colors": ["red"]}}, addresses={"home": [{"street": "a"}]}))
+    session.commit()
+    p.settings["theme"]["colors"]  # Load the expired attributes
+    p.addresses
+
+    stats = tracking_stats()
+    assert stats.live_nodes >= 6
+    assert stats.parent_links >= 4
+    assert stats.tracked_model_classes >= 1
+
+    sizes = {(r.instance, r.key): r.size for r in root_sizes(session)}
+    assert sizes[(p, "settings")] == estimate_size(p.settings) > estimate_size({"theme": {"colors": ["red"]}})
+    assert sizes[(p, "addresses")] > 0
+
+    session.delete(p)
+    session.commit()
+
+
+def test_no_leaks_after_session_close(session):
+    _use_profiles(session.bind)  # Warm up
+    with check_no_leaks(max_leaked_bytes=4096):
+        for _ in range(5):
+            _use_profiles(session.bind)
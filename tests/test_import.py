@@ -0,0 +1,40 @@
+import subprocess
+import sys
+from pathlib import Path
+
+
+def run_python(code: str) -> str:
+    return subprocess.run(
+        [sys.executable, '-c', code],
+        cwd=Path(__file__).parent.parent, capture_output=True, text=True, check=True,
+    ).stdout.strip()
+
+
+def test_pydantic_imported_lazily():
+    assert run_python(
+        "import sys\n"
+        "from sqlalchemy_nested_mutable import MutableDict, json_serializer\n"
+        "d = MutableDict({'a': {'b': [1]}})\n"
+        "d['a']['b'].append(2)\n"
+        "json_serializer(d)\n"
+        "print('pydantic' in sys.modules)\n"
+    ) == 'False'
+
+    assert run_python(
+        "import sys\n"
+        "from sqlalchemy_nested_mutable import MutablePydanticBaseModel\n"
+        "print('pydantic' in sys.modules)\n"
+    ) == 'True'
+
+
+def test_pydantic_types_module_paths():
+    # e.g. Alembic writes `<module>.PydanticType(...)` into migrations
+    assert run_python(
+        "import importlib\n"
+        "from sqlalchemy_nested_mutable.mutable import PydanticType, MutablePydanticBaseModel\n"
+        "from sqlalchemy_nested_mutable.trackable import TrackedPydanticBaseModel\n"
+        "for cls in (PydanticType, MutablePydanticBaseModel, TrackedPydanticBaseModel):\n"
+        "    assert not cls.__module__.rpartition('.')[2].startswith('_'), cls.__module__\n"
+        "    assert getattr(importlib.import_module(cls.__module__), cls.__qualname__) is cls\n"
+        "print('ok')\n"
+    ) == 'ok'
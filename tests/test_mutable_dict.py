@@ -1,13 +1,19 @@
+import gc
+import json
+import weakref
+
 import pytest
 import sqlalchemy as sa
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import (
     DeclarativeBase,
     Mapped,
+    Session,
     mapped_column,
 )
 
-from sqlalchemy_nested_mutable import MutableDict, TrackedDict, TrackedList
+from sqlalchemy_nested_mutable import MutableDict, TrackedDict, TrackedList, json_serializer
+from sqlalchemy_nested_mutable.trackable import TrackedObject
 
 
 class Base(DeclarativeBase):
@@ -20,6 +26,9 @@ class User(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(sa.String(30))
     addresses = mapped_column(MutableDict.as_mutable(JSONB), default=dict)
+    addresses_shallow = mapped_column(MutableDict.as_mutable(JSONB, max_depth=2), default=dict)
+    addresses_restorable = mapped_column(MutableDict.as_mutable(JSONB, restore_on_rollback=True), default=dict)
+    addresses_cow = mapped_column(MutableDict.as_mutable(JSONB, copy_on_write=True), default=dict)
 
 
 @pytest.fixture(scope="module", autouse=True)
@@ -92,3 +101,214 @@ def test_mutable_dict_mixed_with_list(session):
         {"label": "secret0", "address": "789 Moon Street"},
         {"label": "secret1", "address": "791 Moon Street"},
     ]
+
+
+def test_mutable_dict_with_max_depth(session):
+    session.add(u := User(name="baz", addresses_shallow={
+        "home": {"street": "123 Main Street", "geo": {"lat": 40.7, "lng": -74.0}},
+    }))
+    session.commit()
+
+    assert isinstance(u.addresses_shallow, MutableDict)
+    assert isinstance(u.addresses_shallow["home"], TrackedDict)
+    assert type(u.addresses_shallow["home"]["geo"]) is dict
+
+    # Change at a tracked level
+    u.addresses_shallow["home"]["street"] = "124 Main Street"
+    assert session.dirty
+    session.commit()
+    assert u.addresses_shallow["home"]["street"] == "124 Main Street"
+
+    # Change below the tracked levels is not detected
+    u.addresses_shallow["home"]["geo"]["lat"] = 0
+    assert not session.dirty
+    session.commit()
+    assert u.addresses_shallow["home"]["geo"]["lat"] == 40.7
+
+    # Unless the value is reassigned at a tracked level
+    u.addresses_shallow["home"]["geo"] = {"lat": 0, "lng": 0}
+    session.commit()
+    assert u.addresses_shallow["home"]["geo"] == {"lat": 0, "lng": 0}
+
+    # The untracked levels are copied too, not shared with the assigned value
+    template = {"home": {"geo": {"lat": 40.7, "lng": -74.0}}}
+    session.add_all(users := [User(name=f"baz{i}", addresses_shallow=template) for i in range(2)])
+    users[0].addresses_shallow["home"]["geo"]["lat"] = 0
+    assert template["home"]["geo"]["lat"] == 40.7
+    assert users[1].addresses_shallow["home"]["geo"]["lat"] == 40.7
+    session.commit()
+
+
+def test_mutable_dict_inplace_operators(session):
+    session.add(u := User(name="grault", addresses={"home": {"street": "123 Main Street"}, "tags": ["a"]}))
+    session.commit()
+    TrackedObject.make_nested_plain(u.addresses)  # Cache the plain copy
+
+    home = u.addresses["home"]
+    home |= {"city": "New York"}
+    tags = u.addresses["tags"]
+    tags *= 2
+    assert session.dirty
+    assert TrackedObject.make_nested_plain(u.addresses) == {
+        "home": {"street": "123 Main Street", "city": "New York"}, "tags": ["a", "a"],
+    }
+    session.commit()
+    assert u.addresses == {"home": {"street": "123 Main Street", "city": "New York"}, "tags": ["a", "a"]}
+
+
+def test_json_serializer(session):
+    engine = sa.create_engine(session.bind.url, json_serializer=json_serializer)
+    with Session(engine) as session:
+        session.add(u := User(name="qux", addresses={
+            "home": {"street": "123 Main Street", "city": "New York"},
+            "others": [{"label": "secret0", "address": "789 Moon Street", "tags": ["a", 1, None]}],
+        }))
+        session.commit()
+        assert json_serializer(u.addresses) == json.dumps(u.addresses)
+
+        u.addresses["others"][0]["tags"].append({"b": True})
+        u.addresses["home"]["street"] = "124 Main Street"
+        assert json_serializer(u.addresses) == json.dumps(u.addresses)
+        session.commit()
+        assert u.addresses["others"][0]["tags"] == ["a", 1, None, {"b": True}]
+        assert u.addresses["home"]["street"] == "124 Main Street"
+
+        # In-place operators invalidate the cached fragments too
+        home = u.addresses["home"]
+        home |= {"city": "Boston"}
+        tags = u.addresses["others"][0]["tags"]
+        tags *= 2
+        u.addresses["others"].append("x")
+        assert json_serializer(u.addresses) == json.dumps(u.addresses)
+        session.commit()
+        assert u.addresses["home"]["city"] == "Boston"
+        assert len(u.addresses["others"][0]["tags"]) == 8
+    engine.dispose()
+
+
+def test_mutable_dict_restore_on_rollback(session):
+    session.add(u := User(name="quux", addresses_restorable={"home": {"street": "123 Main Street"}}))
+    session.commit()
+    addresses = u.addresses_restorable
+
+    # An unchanged value is kept as is
+    session.rollback()
+    assert "addresses_restorable" in sa.inspect(u).dict
+    assert u.addresses_restorable is addresses
+
+    # A changed value is restored from its committed state, without reloading it
+    u.addresses_restorable["home"]["street"] = "124 Main Street"
+    session.flush()
+    session.rollback()
+    assert "addresses_restorable" in sa.inspect(u).dict
+    assert u.addresses_restorable == {"home": {"street": "123 Main Street"}}
+
+    # The restored value is still tracked
+    u.addresses_restorable["home"]["street"] = "125 Main Street"
+    session.commit()
+    assert u.addresses_restorable == {"home": {"street": "125 Main Street"}}
+
+
+def test_mutable_dict_restore_on_rollback_after_savepoint(session):
+    session.add(u := User(name="quuz", addresses_restorable={"home": {"street": "123 Main Street"}}))
+    session.commit()
+    u.addresses_restorable["home"]["street"]  # Load the expired attribute
+
+    # A released savepoint is not committed yet, so the rollback restores the last committed state
+    with session.begin_nested():
+        u.addresses_restorable["home"]["street"] = "124 Main Street"
+    session.rollback()
+    assert u.addresses_restorable == {"home": {"street": "123 Main Street"}}
+    session.expire(u, ["addresses_restorable"])
+    assert u.addresses_restorable == {"home": {"street": "123 Main Street"}}
+
+    # And the rolled back change is not written by the next one
+    u.addresses_restorable["work"] = "456 Wall Street"
+    session.commit()
+    session.expire(u, ["addresses_restorable"])
+    assert u.addresses_restorable == {"home": {"street": "123 Main Street"}, "work": "456 Wall Street"}
+
+
+def test_mutable_dict_restore_on_rollback_after_commit(session):
+    session.add(u := User(name="quuy", addresses_restorable={"home": {"street": "123 Main Street"}}))
+    session.commit()
+    addresses = weakref.ref(u.addresses_restorable)
+
+    # The commit expires the value, so its snapshot is dropped rather than keeping it alive
+    u.addresses_restorable["home"]["street"] = "124 Main Street"
+    session.commit()
+    gc.collect()
+    assert addresses() is None
+
+    # Unless the session doesn't expire on commit, then the committed values are restored
+    with Session(session.bind, expire_on_commit=False) as other:
+        u2 = other.get(User, u.id)
+        u2.addresses_restorable["work"] = "456 Wall Street"
+        other.commit()
+        u2.addresses_restorable["home"]["street"] = "125 Main Street"
+        other.flush()
+        other.rollback()
+        assert "addresses_restorable" in sa.inspect(u2).dict
+        assert u2.addresses_restorable == {"home": {"street": "124 Main Street"}, "work": "456 Wall Street"}
+
+
+def test_mutable_dict_copy_on_write(session):
+    template = {"home": {"street": "123 Main Street", "tags": ["a", {"b": 1}]}}
+    engine = sa.create_engine(session.bind.url, json_serializer=json_serializer)
+    with Session(engine) as session:
+        session.add_all(users := [User(name=f"corge{i}", addresses_cow=template) for i in range(2)])
+        session.flush()
+        u0, u1 = users
+
+        # Unchanged subtrees are shared, even after being serialized
+        assert isinstance(u0.addresses_cow, MutableDict)
+        assert dict.__getitem__(u0.addresses_cow, "home") is template["home"]
+        assert dict.__getitem__(u1.addresses_cow, "home") is template["home"]
+
+        # Deep change copies the accessed path only
+        u0.addresses_cow["home"]["tags"][1]["b"] = 2
+        assert isinstance(u0.addresses_cow["home"], TrackedDict)
+        assert isinstance(u0.addresses_cow["home"]["tags"], TrackedList)
+        assert u0 in session.dirty and u1 not in session.dirty
+        session.flush()
+
+        # A shared child is handed out as a tracked copy, even by `setdefault`
+        tags = u1.addresses_cow.setdefault("more", [])
+        session.flush()
+        tags.append(1)
+        assert isinstance(tags, TrackedList)
+        assert u1 in session.dirty
+
+        # But the default returned by `pop` is not a child
+        default = {}
+        assert u1.addresses_cow.pop("missing", default) is default
+        session.flush()
+        default["a"] = 1
+        assert u1 not in session.dirty
+        session.commit()
+
+        assert u0.addresses_cow == {"home": {"street": "123 Main Street", "tags": ["a", {"b": 2}]}}
+        assert u1.addresses_cow == {"home": {"street": "123 Main Street", "tags": ["a", {"b": 1}]}, "more": [1]}
+        assert template == {"home": {"street": "123 Main Street", "tags": ["a", {"b": 1}]}}
+    engine.dispose()
+
+
+def test_mutable_dict_coerce_many(session):
+    values = [{"home": {"street": "123 Main Street"}}, None]
+    addresses = MutableDict.coerce_many(values)
+    assert isinstance(addresses[0], MutableDict) and isinstance(addresses[0]["home"], TrackedDict)
+    assert addresses[1] is None
+    assert [s and s.text for s in MutableDict.coerce_many(values, serialize=True)] == [json.dumps(values[0]), None]
+
+    # The rows loaded in the session get the decoded values
+    engine = sa.create_engine(session.bind.url, json_serializer=json_serializer)
+    with Session(engine) as session:
+        session.add(u := User(name="waldo", addresses={}))
+        session.commit()
+        session.execute(sa.update(User), [{"id": u.id, "addresses": MutableDict.coerce_many(values, serialize=True)[0]}])
+        assert isinstance(u.addresses, MutableDict) and isinstance(u.addresses["home"], TrackedDict)
+        session.commit()
+        assert u.addresses == values[0]
+        session.delete(u)
+        session.commit()
+    engine.dispose()
@@ -1,3 +1,4 @@
+import json
 from typing import List
 
 import pytest
@@ -6,11 +7,12 @@ from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy.orm import (
     DeclarativeBase,
     Mapped,
+    Session,
     mapped_column,
 )
 
 
-from sqlalchemy_nested_mutable import MutableList, TrackedList, TrackedDict
+from sqlalchemy_nested_mutable import MutableList, TrackedList, TrackedDict, json_serializer
 
 
 class Base(DeclarativeBase):
@@ -36,6 +38,7 @@ class UserV2(Base):
     name: Mapped[str] = mapped_column(sa.String(30))
     aliases = mapped_column(MutableList[str].as_mutable(JSONB), default=list)
     schedule = mapped_column(MutableList[List[str]].as_mutable(JSONB), default=list)
+    schedule_shallow = mapped_column(MutableList[List[str]].as_mutable(JSONB, max_depth=1), default=list)
 
 
 @pytest.fixture(scope="module", autouse=True)
@@ -138,3 +141,47 @@ def test_mutable_list_mixed_with_dict(session):
     u.schedule[0]["events"].insert(0, "breakfast")
     session.commit()
     assert u.schedule[0] == {"day": "mon", "events": ["breakfast", "meeting", "launch"]}
+
+
+def test_mutable_list_with_max_depth(session):
+    session.add(u := UserV2(name="foo", schedule_shallow=[["meeting", "launch"], ["training"]]))
+    session.commit()
+
+    assert isinstance(u.schedule_shallow, MutableList)
+    assert type(u.schedule_shallow[0]) is list
+
+    # Change at the tracked level
+    u.schedule_shallow.append(["breakfast"])
+    assert session.dirty
+    session.commit()
+    assert u.schedule_shallow == [["meeting", "launch"], ["training"], ["breakfast"]]
+
+    # Change below the tracked levels is not detected
+    u.schedule_shallow[0].append("lunch")
+    assert not session.dirty
+    session.commit()
+    assert u.schedule_shallow[0] == ["meeting", "launch"]
+
+    # Unless the value is reassigned at a tracked level
+    u.schedule_shallow[0] = ["meeting", "lunch"]
+    session.commit()
+    assert u.schedule_shallow == [["meeting", "lunch"], ["training"], ["breakfast"]]
+
+
+def test_mutable_list_coerce_many(session):
+    values = [[["meeting", "launch"]], None]
+    schedules = MutableList.coerce_many(values)
+    assert isinstance(schedules[0], MutableList) and isinstance(schedules[0][0], TrackedList)
+    assert schedules[1] is None
+    assert [s and s.text for s in MutableList.coerce_many(values, serialize=True)] == [json.dumps(values[0]), None]
+
+    # The rows loaded in the session get the decoded values
+    engine = sa.create_engine(session.bind.url, json_serializer=json_serializer)
+    with Session(engine) as session:
+        session.add(u := UserV2(name="foo"))
+        session.commit()
+        session.execute(sa.update(UserV2), [{"id": u.id, "schedule": MutableList.coerce_many(values, serialize=True)[0]}])
+        assert isinstance(u.schedule, MutableList) and isinstance(u.schedule[0], TrackedList)
+        session.commit()
+        assert u.schedule == values[0]
+    engine.dispose()
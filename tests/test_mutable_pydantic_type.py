@@ -1,11 +1,15 @@
+import functools
+import json
 from typing import Optional, List
 
 import pytest
 from sqlalchemy_nested_mutable._compat import pydantic
 import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import (
     DeclarativeBase,
     Mapped,
+    Session,
     mapped_column,
 )
 
@@ -13,7 +17,9 @@ from sqlalchemy_nested_mutable import (
     MutablePydanticBaseModel,
     TrackedPydanticBaseModel,
     TrackedList,
+    json_serializer,
 )
+from sqlalchemy_nested_mutable.trackable import TrackedObject
 
 
 class Base(DeclarativeBase):
@@ -38,6 +44,15 @@ class User(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(sa.String(30))
     addresses: Mapped[Addresses] = mapped_column(Addresses.as_mutable(), nullable=True)
+    addresses_shallow: Mapped[Addresses] = mapped_column(Addresses.as_mutable(max_depth=2), nullable=True)
+
+
+class UserWithCache(Base):
+    __tablename__ = "user_account_with_cache"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(sa.String(30))
+    addresses: Mapped[Addresses] = mapped_column(Addresses.as_mutable(cache_size=2), nullable=True)
 
 
 @pytest.fixture(scope="module", autouse=True)
@@ -46,6 +61,7 @@ def _with_tables(session):
     yield
     session.execute(sa.text("""
     DROP TABLE user_account CASCADE;
+    DROP TABLE user_account_with_cache CASCADE;
     """))
     session.commit()
 
@@ -80,3 +96,189 @@ def test_mutable_pydantic_type(session):
     u.addresses.home[0].street = "bar4"
     session.commit()
     assert u.addresses.home[0].dict(exclude_none=True) == {"street": "bar4", "city": "baz"}
+
+
+def test_mutable_pydantic_type_with_max_depth(session):
+    session.add(u := User(name="foo", addresses_shallow={
+        "preferred": {"street": "bar", "city": "baz"},
+        "home": [{"street": "123 Main Street", "city": "New York"}],
+    }))
+    session.commit()
+
+    assert isinstance(u.addresses_shallow.preferred, TrackedPydanticBaseModel)
+    assert isinstance(u.addresses_shallow.home, TrackedList)
+    assert type(u.addresses_shallow.home[0]) is Addresses.AddressItem
+
+    # Change at a tracked level
+    u.addresses_shallow.preferred.street = "qux"
+    assert session.dirty
+    session.commit()
+    assert u.addresses_shallow.preferred.street == "qux"
+
+    # Change below the tracked levels is not detected
+    u.addresses_shallow.home[0].street = "124 Main Street"
+    assert not session.dirty
+    session.commit()
+    assert u.addresses_shallow.home[0].street == "123 Main Street"
+
+    # An instance of the model itself is taken as it is, and stays tracked as deep as the column tracks
+    u.addresses_shallow = addresses = Addresses(
+        preferred={"street": "bar", "city": "baz"}, home=[{"street": "123 Main Street", "city": "New York"}]
+    )
+    assert u.addresses_shallow is addresses
+    assert type(addresses.home[0]) is Addresses.AddressItem
+    session.flush()
+    addresses.home[0].street = "124 Main Street"
+    assert not session.dirty
+    addresses.preferred.street = "quux"
+    assert session.dirty
+    session.commit()
+    assert u.addresses_shallow.preferred.street == "quux"
+
+
+def test_mutable_pydantic_type_with_cache(session):
+    addresses = {"preferred": {"street": "bar", "city": "baz"}, "home": [{"street": "bar", "city": "baz"}]}
+    session.add_all([UserWithCache(name=f"foo{i}", addresses=addresses) for i in range(3)])
+    session.commit()
+    session.expunge_all()
+
+    cache_info = UserWithCache.__table__.c.addresses.type.cache_info
+    users = session.scalars(sa.select(UserWithCache).order_by(UserWithCache.id)).all()
+    assert cache_info()[:2] == (2, 1)  # (hits, misses)
+
+    # Each row gets its own tracked copy of the cached value
+    u0, u1 = users[0], users[1]
+    assert u0.addresses == u1.addresses
+    assert u0.addresses is not u1.addresses
+    assert isinstance(u0.addresses.home[0], TrackedPydanticBaseModel)
+
+    u0.addresses.home[0].street = "bar2"
+    assert u1.addresses.home[0].street == "bar"
+    session.commit()
+    session.expunge_all()
+
+    users = session.scalars(sa.select(UserWithCache).order_by(UserWithCache.id)).all()
+    assert users[0].addresses.home[0].street == "bar2"
+    assert users[1].addresses.home[0].street == "bar"
+    assert cache_info().currsize == 2
+
+
+def test_mutable_pydantic_type_bind_param(session):
+    session.add(u := User(name="foo", addresses={
+        "preferred": {"street": "bar", "city": "baz"},
+        "home": [{"street": "bar", "city": "baz"}],
+    }))
+    session.commit()
+
+    process_bind_param = User.__table__.c.addresses.type.process_bind_param
+    value = process_bind_param(u.addresses, session.bind.dialect)
+    assert "_parents" not in value
+    assert value == {k: v for k, v in u.addresses.dict().items() if k != "_parents"}
+
+    # Serialized subtrees are reused until changed
+    u.addresses.preferred.street = "bar2"
+    new_value = process_bind_param(u.addresses, session.bind.dialect)
+    assert new_value["preferred"]["street"] == "bar2"
+    assert new_value["home"] is value["home"]
+
+    u.addresses.home[0].street = "bar3"
+    assert process_bind_param(u.addresses, session.bind.dialect)["home"] == [
+        {"street": "bar3", "city": "baz", "area": None}
+    ]
+    session.commit()
+
+
+def _check_json_serializer(session, name):
+    session.add(u := User(name=name, addresses={
+        "preferred": {"street": "bar", "city": "baz"},
+        "home": [{"street": "bar", "city": "baz"}],
+    }))
+    session.commit()
+
+    # Tracked models are handed to the serializer as they are
+    process_bind_param = User.__table__.c.addresses.type.process_bind_param
+    assert process_bind_param(u.addresses, session.bind.dialect) is u.addresses
+    assert json.loads(json_serializer(u.addresses)) == TrackedObject.make_nested_plain(u.addresses)
+
+    u.addresses.home[0].street = "bar2"
+    session.commit()
+    assert u.addresses.home[0].street == "bar2"
+    assert u.addresses.preferred.street == "bar"
+
+
+def test_mutable_pydantic_type_with_json_serializer(session):
+    engine = sa.create_engine(session.bind.url, json_serializer=json_serializer)
+    with Session(engine) as session:
+        _check_json_serializer(session, "qux")
+    engine.dispose()
+
+
+def test_mutable_pydantic_type_with_wrapped_json_serializer(session):
+    @functools.wraps(json_serializer)
+    def wrapped(obj):
+        return json_serializer(obj)
+
+    process_bind_param = User.__table__.c.addresses.type.process_bind_param
+    addresses = Addresses(preferred={"street": "bar", "city": "baz"})
+    for serializer in (functools.partial(json_serializer), wrapped):
+        engine = sa.create_engine(session.bind.url, json_serializer=serializer)
+        assert process_bind_param(addresses, engine.dialect) is addresses
+        engine.dispose()
+
+    # Other serializers get a plain copy
+    engine = sa.create_engine(session.bind.url, json_serializer=lambda obj: json.dumps(obj))
+    assert process_bind_param(addresses, engine.dialect) == TrackedObject.make_nested_plain(addresses)
+    assert type(process_bind_param(addresses, engine.dialect)) is dict
+    engine.dispose()
+
+
+def test_mutable_pydantic_type_with_json_serializer_psycopg(session):
+    pytest.importorskip("psycopg")
+    engine = sa.create_engine(session.bind.url.set(drivername="postgresql+psycopg"), json_serializer=json_serializer)
+    with Session(engine) as session:
+        _check_json_serializer(session, "qux_psycopg")
+    engine.dispose()
+
+
+async def test_mutable_pydantic_type_with_json_serializer_asyncpg(session):
+    pytest.importorskip("asyncpg")
+    engine = create_async_engine(session.bind.url.set(drivername="postgresql+asyncpg"), json_serializer=json_serializer)
+    async with AsyncSession(engine) as session:
+        await session.run_sync(_check_json_serializer, "qux_asyncpg")
+    await engine.dispose()
+
+
+def test_mutable_pydantic_type_coerce_many(session):
+    session.add_all(users := [User(name=f"quux{i}") for i in range(3)])
+    session.commit()
+    values = [{"preferred": {"street": f"{i} Main Street", "city": "baz"}} for i in range(2)] + [None]
+
+    # Validated (e.g. defaults filled in) unlike plain values of a bulk UPDATE
+    addresses = Addresses.coerce_many(values)
+    assert isinstance(addresses[0], Addresses) and addresses[0].home == [] and addresses[2] is None
+    session.execute(sa.update(User), [{"id": u.id, "addresses": a} for u, a in zip(users, addresses)])
+    session.commit()
+    assert users[1].addresses.preferred.street == "1 Main Street"
+    assert users[2].addresses is None
+
+    for serialize in (False, True):
+        with pytest.raises(pydantic.ValidationError, match=r"1 -> preferred -> city"):
+            Addresses.coerce_many([{}, {"preferred": {"street": "bar"}}], serialize=serialize)
+        with pytest.raises(pydantic.ValidationError, match=r"1\n  value is not a valid dict"):
+            Addresses.coerce_many([{}, [1, 2]], serialize=serialize)
+
+    engine = sa.create_engine(session.bind.url, json_serializer=json_serializer)
+    with Session(engine) as session:
+        serialized = Addresses.coerce_many(values, serialize=True)
+        assert [s and s.text for s in serialized] == [a and json_serializer(a) for a in addresses]
+        # The rows loaded in the session get the decoded values
+        loaded = [session.get(User, u.id) for u in users]
+        session.execute(sa.update(User), [
+            {"id": u.id, "addresses": a} for u, a in zip(users, reversed(serialized))
+        ])
+        assert loaded[0].addresses is None
+        assert isinstance(loaded[2].addresses, Addresses) and loaded[2].addresses.preferred.street == "0 Main Street"
+        session.commit()
+        assert session.get(User, users[0].id).addresses is None
+        assert session.get(User, users[2].id).addresses.preferred.street == "0 Main Street"
+    engine.dispose()